@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""Synthetic NYC TLC trip files for offline ingest benchmarks.
+
+Columns, order and types follow the real yellow/green/FHV files (and the
+`dtype`/`parse_dates` maps in the ingest scripts); values are random but
+plausible, with the occasional null where the real data has them.
+
+    python bench/synth_tlc.py --taxi_type yellow --rows 1000000 --format csv.gz --out data/
+"""
+from datetime import datetime
+from pathlib import Path
+
+import click
+import numpy as np
+import pandas as pd
+
+NUM_ZONES = 265
+
+file_formats = ["csv.gz", "parquet"]
+
+
+def _timestamps(rng, rows, year, month):
+    start = np.datetime64(datetime(year, month, 1), "s")
+    pickup = start + rng.integers(0, 28 * 24 * 3600, rows).astype("timedelta64[s]")
+    dropoff = pickup + rng.integers(60, 3600, rows).astype("timedelta64[s]")
+    return pd.to_datetime(pickup), pd.to_datetime(dropoff)
+
+
+def _with_nulls(rng, values, dtype, rate=0.02):
+    series = pd.Series(values, dtype=dtype)
+    series[rng.random(len(series)) < rate] = pd.NA
+    return series
+
+
+def _fares(rng, rows):
+    fare = np.round(rng.gamma(2.0, 7.0, rows), 2)
+    tip = np.round(fare * rng.choice([0, 0.1, 0.2], rows), 2)
+    return {
+        "fare_amount": fare,
+        "extra": rng.choice([0.0, 0.5, 1.0, 2.5], rows),
+        "mta_tax": np.full(rows, 0.5),
+        "tip_amount": tip,
+        "tolls_amount": rng.choice([0.0, 0.0, 0.0, 6.55], rows),
+        "improvement_surcharge": np.full(rows, 0.3),
+        "total_amount": np.round(fare + tip + 0.8, 2),
+    }
+
+
+def yellow_frame(rows, year=2021, month=1, seed=0):
+    rng = np.random.default_rng(seed)
+    pickup, dropoff = _timestamps(rng, rows, year, month)
+    fares = _fares(rng, rows)
+    return pd.DataFrame({
+        "VendorID": _with_nulls(rng, rng.integers(1, 3, rows), "Int64"),
+        "tpep_pickup_datetime": pickup,
+        "tpep_dropoff_datetime": dropoff,
+        "passenger_count": _with_nulls(rng, rng.integers(0, 7, rows), "Int64"),
+        "trip_distance": np.round(rng.exponential(3.0, rows), 2),
+        "RatecodeID": _with_nulls(rng, rng.integers(1, 7, rows), "Int64"),
+        "store_and_fwd_flag": _with_nulls(rng, rng.choice(["N", "Y"], rows, p=[0.99, 0.01]), "string"),
+        "PULocationID": rng.integers(1, NUM_ZONES + 1, rows),
+        "DOLocationID": rng.integers(1, NUM_ZONES + 1, rows),
+        "payment_type": _with_nulls(rng, rng.integers(1, 5, rows), "Int64"),
+        **fares,
+        "congestion_surcharge": rng.choice([0.0, 2.5], rows),
+    })
+
+
+def green_frame(rows, year=2025, month=11, seed=0):
+    rng = np.random.default_rng(seed)
+    pickup, dropoff = _timestamps(rng, rows, year, month)
+    fares = _fares(rng, rows)
+    return pd.DataFrame({
+        "VendorID": rng.integers(1, 3, rows),
+        "lpep_pickup_datetime": pickup,
+        "lpep_dropoff_datetime": dropoff,
+        "store_and_fwd_flag": _with_nulls(rng, rng.choice(["N", "Y"], rows, p=[0.99, 0.01]), "string"),
+        "RatecodeID": _with_nulls(rng, rng.integers(1, 7, rows), "Int64"),
+        "PULocationID": rng.integers(1, NUM_ZONES + 1, rows),
+        "DOLocationID": rng.integers(1, NUM_ZONES + 1, rows),
+        "passenger_count": _with_nulls(rng, rng.integers(0, 7, rows), "Int64"),
+        "trip_distance": np.round(rng.exponential(3.0, rows), 2),
+        **{k: v for k, v in fares.items() if k not in ("improvement_surcharge", "total_amount")},
+        "ehail_fee": np.full(rows, np.nan),
+        "improvement_surcharge": fares["improvement_surcharge"],
+        "total_amount": fares["total_amount"],
+        "payment_type": _with_nulls(rng, rng.integers(1, 5, rows), "Int64"),
+        "trip_type": _with_nulls(rng, rng.integers(1, 3, rows), "Int64"),
+        "congestion_surcharge": rng.choice([0.0, 2.75], rows),
+    })
+
+
+def fhv_frame(rows, year=2019, month=1, seed=0):
+    rng = np.random.default_rng(seed)
+    pickup, dropoff = _timestamps(rng, rows, year, month)
+    bases = np.array([f"B{n:05d}" for n in rng.integers(1, 3000, 200)])
+    return pd.DataFrame({
+        "dispatching_base_num": bases[rng.integers(0, len(bases), rows)],
+        "pickup_datetime": pickup,
+        "dropOff_datetime": dropoff,
+        "PUlocationID": _with_nulls(rng, rng.integers(1, NUM_ZONES + 1, rows), "Int64", rate=0.2),
+        "DOlocationID": _with_nulls(rng, rng.integers(1, NUM_ZONES + 1, rows), "Int64", rate=0.1),
+        "SR_Flag": _with_nulls(rng, np.ones(rows, dtype=int), "Int64", rate=0.9),
+        "Affiliated_base_number": bases[rng.integers(0, len(bases), rows)],
+    })
+
+
+def zones_frame():
+    ids = np.arange(1, NUM_ZONES + 1)
+    return pd.DataFrame({
+        "LocationID": ids,
+        "Borough": np.resize(["Manhattan", "Queens", "Brooklyn", "Bronx", "Staten Island", "EWR"], len(ids)),
+        "Zone": [f"Zone {i}" for i in ids],
+        "service_zone": np.resize(["Yellow Zone", "Boro Zone"], len(ids)),
+    })
+
+
+frames = {"yellow": yellow_frame, "green": green_frame, "fhv": fhv_frame}
+
+
+def write(df, path):
+    path = Path(path)
+    if path.name.endswith(".parquet"):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False, compression="infer", date_format="%Y-%m-%d %H:%M:%S")
+    return path
+
+
+@click.command()
+@click.option("--taxi_type", default="yellow", type=click.Choice(list(frames)), help="Schema to generate")
+@click.option("--rows", default=100000, type=int, help="Number of trips")
+@click.option("--year", default=2021, type=int, help="Year of the pickup timestamps")
+@click.option("--month", default=1, type=int, help="Month of the pickup timestamps")
+@click.option("--format", "file_format", default="csv.gz", type=click.Choice(file_formats), help="Output format")
+@click.option("--seed", default=0, type=int, help="Random seed")
+@click.option("--out", default=".", help="Output directory")
+def main(taxi_type, rows, year, month, file_format, seed, out):
+    """Write one synthetic month named like the TLC file it stands in for."""
+    Path(out).mkdir(parents=True, exist_ok=True)
+    path = Path(out) / f"{taxi_type}_tripdata_{year}-{month:02d}.{file_format}"
+    write(frames[taxi_type](rows, year, month, seed), path)
+    print(path)
+
+
+if __name__ == "__main__":
+    main()
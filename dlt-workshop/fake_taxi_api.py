@@ -0,0 +1,138 @@
+"""Local stand-in for the zoomcamp taxi API, for offline runs and throughput benchmarks.
+
+Serves `pages` pages of `page_size` synthetic trips at /?page=N (1-based) and an
+empty list past the end, like the real API. `latency` adds a per-request delay
+and `error_rate` answers that share of requests with a 503 to exercise retries.
+
+    python fake_taxi_api.py --port 8000                      # serve until Ctrl-C
+    python fake_taxi_api.py --latency 0.2 --bench 1 4 8      # compare page concurrency
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, List
+from urllib.parse import parse_qs, urlparse
+
+PAYMENT_TYPES = ["Credit", "CASH", "Cash", "No Charge", "Dispute"]
+VENDORS = ["VTS", "CMT", "DDS"]
+
+
+def make_trip(rng: random.Random) -> dict:
+    pickup = datetime(2009, 6, 1) + timedelta(seconds=rng.randrange(30 * 24 * 3600))
+    fare = round(rng.uniform(2.5, 60), 2)
+    tip = round(fare * rng.choice([0, 0, 0.1, 0.2]), 2)
+    return {
+        "End_Lat": round(rng.uniform(40.6, 40.9), 6),
+        "End_Lon": round(rng.uniform(-74.05, -73.75), 6),
+        "Fare_Amt": fare,
+        "Passenger_Count": rng.randint(1, 6),
+        "Payment_Type": rng.choice(PAYMENT_TYPES),
+        "Rate_Code": None,
+        "Start_Lat": round(rng.uniform(40.6, 40.9), 6),
+        "Start_Lon": round(rng.uniform(-74.05, -73.75), 6),
+        "Tip_Amt": tip,
+        "Tolls_Amt": 0.0,
+        "Total_Amt": round(fare + tip, 2),
+        "Trip_Distance": round(rng.uniform(0.3, 20), 2),
+        "Trip_Dropoff_DateTime": (pickup + timedelta(minutes=rng.randint(2, 60))).strftime("%Y-%m-%d %H:%M:%S"),
+        "Trip_Pickup_DateTime": pickup.strftime("%Y-%m-%d %H:%M:%S"),
+        "mta_tax": None,
+        "store_and_forward": None,
+        "surcharge": 0.0,
+        "vendor_name": rng.choice(VENDORS),
+    }
+
+
+def make_pages(pages: int, page_size: int, seed: int = 0) -> List[bytes]:
+    rng = random.Random(seed)
+    return [json.dumps([make_trip(rng) for _ in range(page_size)]).encode() for _ in range(pages)]
+
+
+def make_handler(pages: List[bytes], latency: float, error_rate: float):
+    rng = random.Random()
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+        def do_GET(self) -> None:
+            if latency:
+                time.sleep(latency)
+            with lock:
+                fail = rng.random() < error_rate
+            if fail:
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            try:
+                page = int(parse_qs(urlparse(self.path).query).get("page", ["1"])[0])
+            except ValueError:
+                page = 1
+            body = pages[page - 1] if 1 <= page <= len(pages) else b"[]"
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    return Handler
+
+
+@contextmanager
+def serve(
+    pages: int = 10,
+    page_size: int = 1000,
+    latency: float = 0.0,
+    error_rate: float = 0.0,
+    port: int = 0,
+) -> Iterator[str]:
+    """Run the fake API on a background thread and yield its base URL."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(make_pages(pages, page_size), latency, error_rate))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def bench(base_url: str, concurrency: List[int]) -> None:
+    from taxi_pipeline import taxi_pipeline
+
+    for workers in concurrency:
+        start = time.perf_counter()
+        rows = sum(1 for _ in taxi_pipeline(parallel_pages=workers, base_url=base_url))
+        elapsed = time.perf_counter() - start
+        mode = "sequential" if workers == 0 else f"{workers} pages"
+        print(f"{mode:>12}: {rows} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--page_size", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--bench", type=int, nargs="*",
+                        help="Page concurrencies to time (0 = sequential paginator), then exit")
+    args = parser.parse_args()
+
+    if args.bench is not None:
+        with serve(args.pages, args.page_size, args.latency, args.error_rate) as url:
+            bench(url, args.bench or [0, 4])
+    else:
+        with serve(args.pages, args.page_size, args.latency, args.error_rate, args.port) as url:
+            print(f"Serving on {url}")
+            threading.Event().wait()
@@ -45,7 +45,8 @@ def _(ibis, pd):
                     continue
 
             if taxi_schemas:
-                schema = sorted(taxi_schemas)[-1]
+                # The stable dataset from `taxi_pipeline.py --prod`, else the newest dev_mode one
+                schema = "nyc_taxi" if "nyc_taxi" in taxi_schemas else sorted(taxi_schemas)[-1]
                 t = con.table("taxi_data", database=schema)
                 
                 total_rows = t.count().execute()
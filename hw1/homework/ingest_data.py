@@ -1,9 +1,26 @@
 #!/usr/bin/env python
+import math
+import shutil
+import sys
+import tempfile
+import urllib.request
+from pathlib import Path
+from time import time
+
 import click
 import pandas as pd
+import pyarrow.parquet as pq
 from sqlalchemy import create_engine
 from tqdm.auto import tqdm
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+import pg_load  # noqa: E402
+
+try:
+    import tlc_cache
+except ImportError:  # copied out without tlc_cache.py; download every time
+    tlc_cache = None
+
 dtype = {
     "VendorID": "Int64",
     "passenger_count": "Int64",
@@ -25,43 +42,96 @@ dtype = {
 
 parse_dates = ["tpep_pickup_datetime", "tpep_dropoff_datetime"]
 
+def cached(url):
+    """Local copy of url from the shared download cache, or the URL itself without it."""
+    return tlc_cache.fetch(url) if tlc_cache else url
+
+
+def download(url, dest):
+    """Stream url to dest in 1 MiB blocks without holding the body in memory."""
+    with urllib.request.urlopen(url) as response, open(dest, "wb") as f:
+        shutil.copyfileobj(response, f, length=1 << 20)
+
+
+def iter_parquet_chunks(path, chunksize):
+    """Yield DataFrames of at most chunksize rows, decoding one record batch at a time."""
+    offset = 0
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+        df_chunk = batch.to_pandas()
+        df_chunk.index = df_chunk.index + offset
+        offset += len(df_chunk)
+        yield df_chunk
+
+
 @click.command()
 @click.option("--pg_user", default="root", help="PostgreSQL user")
 @click.option("--pg_pass", default="root", help="PostgreSQL password")
 @click.option("--pg_host", default="pgdatabase", help="PostgreSQL host")
 @click.option("--pg_port", default=5432, type=int, help="PostgreSQL port")
 @click.option("--pg_db", default="ny_taxi", help="PostgreSQL database name")
+@click.option("--db_url", default=None, help="SQLAlchemy URL overriding the --pg_* options, e.g. sqlite:///bench.db")
+@click.option("--year", default=2025, type=int, help="Year of the data")
+@click.option("--month", default=11, type=int, help="Month of the data")
 @click.option("--target_table", default="green_trip_data", help="Target table name")
 @click.option("--chunksize", default=100000, type=int, help="Chunk size for reading CSV")
-def run(pg_user, pg_pass, pg_host, pg_port, pg_db, target_table, chunksize):
-    url = "https://d37ci6vzurychx.cloudfront.net/trip-data/green_tripdata_2025-11.parquet"
-    engine = create_engine(f"postgresql://{pg_user}:{pg_pass}@{pg_host}:{pg_port}/{pg_db}")
+@click.option("--load_method", default="insert", type=click.Choice(["insert", "copy"]),
+              help="insert: DataFrame.to_sql, copy: COPY ... FROM STDIN")
+@click.option("--staging", is_flag=True,
+              help="Load into an UNLOGGED staging table, index it, then swap it in with one rename")
+@click.option("--partitioned", is_flag=True,
+              help="Attach the month as a partition of a table range-partitioned on pickup datetime")
+@click.option("--compact", is_flag=True, help="Downcast chunks to compact_dtype and create narrow columns")
+def run(pg_user, pg_pass, pg_host, pg_port, pg_db, db_url, year, month, target_table, chunksize, load_method, staging,
+        partitioned, compact):
+    url = f"https://d37ci6vzurychx.cloudfront.net/trip-data/green_tripdata_{year}-{month:02d}.parquet"
+    engine = create_engine(db_url or f"postgresql://{pg_user}:{pg_pass}@{pg_host}:{pg_port}/{pg_db}")
 
     print("Ingesting taxi zone lookup data...")
     zones_url = "https://github.com/DataTalksClub/nyc-tlc-data/releases/download/misc/taxi_zone_lookup.csv"
-    df_zones = pd.read_csv(zones_url)
+    df_zones = pd.read_csv(cached(zones_url))
     df_zones.to_sql("taxi_zones", con=engine, if_exists="replace", index=False)
     print(f"Successfully ingested {len(df_zones)} taxi zones")
 
     print(f"Ingesting green taxi trip data from {url}...")
-    df = pd.read_parquet(url)
-    total_rows = len(df)
-    num_chunks = (total_rows // chunksize) + 1
-    first = True
+    if partitioned:
+        load_table = f"{target_table}_{year}_{month:02d}_load"
+    elif staging:
+        load_table = f"{target_table}_staging"
+    else:
+        load_table = target_table
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if tlc_cache:
+            path = tlc_cache.fetch(url)
+        else:
+            path = Path(tmp_dir) / url.rsplit("/", 1)[-1]
+            download(url, path)
 
-    for i in tqdm(range(num_chunks)):
-        start_idx = i * chunksize
-        end_idx = min((i + 1) * chunksize, total_rows)
-        df_chunk = df.iloc[start_idx:end_idx]
+        parquet_file = pq.ParquetFile(path)
+        datetime_cols = [c for c in parquet_file.schema_arrow.names if c.endswith("_datetime")]
+        num_rows = parquet_file.metadata.num_rows
+        if num_rows == 0 and (staging or partitioned):
+            raise click.ClickException(f"{url} has no rows; nothing to swap in")
+        num_chunks = math.ceil(num_rows / chunksize)
+        first = True
 
-        if len(df_chunk) == 0:
-            continue
+        pbar = tqdm(iter_parquet_chunks(path, chunksize), total=num_chunks)
+        for df_chunk in pbar:
+            if compact:
+                df_chunk = pg_load.downcast(df_chunk)
+            if first:
+                pg_load.create_table(df_chunk, load_table, engine, unlogged=staging)
+                first = False
 
-        if first:
-            df_chunk.head(0).to_sql(name=target_table, con=engine, if_exists="replace")
-            first = False
+            t0 = time()
+            with engine.begin() as conn:
+                pg_load.load_chunk(df_chunk, load_table, conn, load_method)
+            pbar.set_postfix(rows_per_sec=f"{len(df_chunk) / (time() - t0):,.0f}")
 
-        df_chunk.to_sql(name=target_table, con=engine, if_exists="append")
+    if partitioned:
+        pg_load.attach_partition(engine, load_table, target_table, year, month, datetime_cols, url.rsplit("/", 1)[-1],
+                                 unlogged=staging)
+    elif staging:
+        pg_load.swap_in(engine, load_table, target_table, datetime_cols)
 
 if __name__ == "__main__":
     run()
\ No newline at end of file
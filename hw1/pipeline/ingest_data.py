@@ -1,11 +1,27 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import io
+import queue
+import sys
+import threading
+import urllib.request
+from pathlib import Path
+from time import time
+
 import click
 import pandas as pd
 from sqlalchemy import create_engine
 from tqdm.auto import tqdm
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+import pg_load  # noqa: E402
+
+try:
+    import tlc_cache
+except ImportError:  # copied out without tlc_cache.py; download every time
+    tlc_cache = None
+
 dtype = {
     "VendorID": "Int64",
     "passenger_count": "Int64",
@@ -30,6 +46,115 @@ parse_dates = [
     "tpep_dropoff_datetime"
 ]
 
+_DONE = object()
+
+
+class QueueReader(io.RawIOBase):
+    """Read-only file over a queue of byte blocks, fed by the fetcher thread."""
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.pending = memoryview(b'')
+        self.eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.pending and not self.eof:
+            block = self.blocks.get()
+            if block is _DONE:
+                self.eof = True
+            elif isinstance(block, BaseException):
+                raise block
+            else:
+                self.pending = memoryview(block)
+        n = min(len(b), len(self.pending))
+        b[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+
+def read_blocks(url):
+    if tlc_cache:
+        yield from tlc_cache.iter_blocks(url)
+        return
+    with urllib.request.urlopen(url) as response:
+        while block := response.read(1 << 20):
+            yield block
+
+
+def fetch(url, blocks, stats):
+    """Stage 1: download the raw (still gzipped) file in 1 MiB blocks, or replay it from the cache."""
+    try:
+        for block in read_blocks(url):
+            blocks.put(block)
+            stats['fetched_bytes'] += len(block)
+        blocks.put(_DONE)
+    except BaseException as e:
+        blocks.put(e)
+
+
+def parse(blocks, chunks, chunksize, stats, compact=False):
+    """Stage 2: decompress and parse the byte stream into DataFrame chunks."""
+    try:
+        reader = io.BufferedReader(QueueReader(blocks), buffer_size=1 << 20)
+        df_iter = pd.read_csv(
+            reader,
+            compression='gzip',
+            dtype=dtype,
+            parse_dates=parse_dates,
+            iterator=True,
+            chunksize=chunksize,
+        )
+        for df_chunk in df_iter:
+            chunks.put(pg_load.downcast(df_chunk) if compact else df_chunk)
+            stats['parsed_rows'] += len(df_chunk)
+        chunks.put(_DONE)
+    except BaseException as e:
+        chunks.put(e)
+
+
+def run_pipelined(url, target_table, engine, chunksize, load_method, queue_size, unlogged=False, compact=False):
+    """Overlap download, parsing and loading; stage 3 (the writer) runs on the calling thread.
+
+    Bounded queues give backpressure: a slow database stalls the parser, which stalls the fetcher.
+    """
+    blocks = queue.Queue(maxsize=16)
+    chunks = queue.Queue(maxsize=queue_size)
+    stats = {'fetched_bytes': 0, 'parsed_rows': 0}
+
+    threading.Thread(target=fetch, args=(url, blocks, stats), daemon=True).start()
+    threading.Thread(target=parse, args=(blocks, chunks, chunksize, stats, compact), daemon=True).start()
+
+    first = True
+    written_rows = 0
+    started = time()
+
+    pbar = tqdm(unit='chunk')
+    while (df_chunk := chunks.get()) is not _DONE:
+        if isinstance(df_chunk, BaseException):
+            raise df_chunk
+
+        if first:
+            pg_load.create_table(df_chunk, target_table, engine, unlogged=unlogged)
+            first = False
+
+        with engine.begin() as conn:
+            pg_load.load_chunk(df_chunk, target_table, conn, load_method)
+        written_rows += len(df_chunk)
+
+        elapsed = time() - started
+        pbar.update()
+        pbar.set_postfix(
+            fetch_mb_s=f"{stats['fetched_bytes'] / elapsed / 1e6:.1f}",
+            parse_rows_s=f"{stats['parsed_rows'] / elapsed:,.0f}",
+            write_rows_s=f'{written_rows / elapsed:,.0f}',
+            raw_q=blocks.qsize(),
+            chunk_q=chunks.qsize(),
+        )
+    pbar.close()
+
 
 @click.command()
 @click.option('--pg_user', default='root', help='PostgreSQL user')
@@ -37,43 +162,67 @@ parse_dates = [
 @click.option('--pg_host', default='localhost', help='PostgreSQL host')
 @click.option('--pg_port', default=5432, type=int, help='PostgreSQL port')
 @click.option('--pg_db', default='ny_taxi', help='PostgreSQL database name')
+@click.option('--db_url', default=None, help='SQLAlchemy URL overriding the --pg_* options, e.g. sqlite:///bench.db')
 @click.option('--year', default=2021, type=int, help='Year of the data')
 @click.option('--month', default=1, type=int, help='Month of the data')
 @click.option('--target_table', default='yellow_taxi_data', help='Target table name')
 @click.option('--chunksize', default=100000, type=int, help='Chunk size for reading CSV')
-def run(pg_user, pg_pass, pg_host, pg_port, pg_db, year, month, target_table, chunksize):
+@click.option('--load_method', default='insert', type=click.Choice(['insert', 'copy']),
+              help='insert: DataFrame.to_sql, copy: COPY ... FROM STDIN')
+@click.option('--pipelined', is_flag=True, help='Run fetch, parse and load as concurrent stages')
+@click.option('--queue_size', default=2, type=int, help='Parsed chunks buffered between parser and writer')
+@click.option('--staging', is_flag=True,
+              help='Load into an UNLOGGED staging table, index it, then swap it in with one rename')
+@click.option('--partitioned', is_flag=True,
+              help='Attach the month as a partition of a table range-partitioned on pickup datetime')
+@click.option('--compact', is_flag=True, help='Downcast chunks to compact_dtype and create narrow columns')
+def run(pg_user, pg_pass, pg_host, pg_port, pg_db, db_url, year, month, target_table, chunksize, load_method,
+        pipelined, queue_size, staging, partitioned, compact):
     """Ingest NYC taxi data into PostgreSQL database."""
-   # prefix = 'https://github.com/DataTalksClub/nyc-tlc-data/releases/download/yellow'
-   # url = f'{prefix}/yellow_tripdata_{year}-{month:02d}.csv.gz'
-     #prefix = 'https://github.com/DataTalksClub/nyc-tlc-data/releases/download/yellow'
-     url = 'https://d37ci6vzurychx.cloudfront.net/trip-data/green_tripdata_2025-11.parquet'
+    prefix = 'https://github.com/DataTalksClub/nyc-tlc-data/releases/download/yellow'
+    url = f'{prefix}/yellow_tripdata_{year}-{month:02d}.csv.gz'
 
-    engine = create_engine(f'postgresql://{pg_user}:{pg_pass}@{pg_host}:{pg_port}/{pg_db}')
+    engine = create_engine(db_url or f'postgresql://{pg_user}:{pg_pass}@{pg_host}:{pg_port}/{pg_db}')
 
-    df_iter = pd.read_csv(
-        url,
-        dtype=dtype,
-        parse_dates=parse_dates,
-        iterator=True,
-        chunksize=chunksize,
-    )
+    if partitioned:
+        load_table = f'{target_table}_{year}_{month:02d}_load'
+    elif staging:
+        load_table = f'{target_table}_staging'
+    else:
+        load_table = target_table
 
-    first = True
+    if pipelined:
+        run_pipelined(url, load_table, engine, chunksize, load_method, queue_size,
+                      unlogged=staging, compact=compact)
+    else:
+        df_iter = pd.read_csv(
+            tlc_cache.fetch(url) if tlc_cache else url,
+            dtype=dtype,
+            parse_dates=parse_dates,
+            iterator=True,
+            chunksize=chunksize,
+        )
 
-    for df_chunk in tqdm(df_iter):
-        if first:
-            df_chunk.head(0).to_sql(
-                name=target_table,
-                con=engine,
-                if_exists='replace'
-            )
-            first = False
+        first = True
 
-        df_chunk.to_sql(
-            name=target_table,
-            con=engine,
-            if_exists='append'
-        )
+        pbar = tqdm(df_iter)
+        for df_chunk in pbar:
+            if compact:
+                df_chunk = pg_load.downcast(df_chunk)
+            if first:
+                pg_load.create_table(df_chunk, load_table, engine, unlogged=staging)
+                first = False
+
+            t0 = time()
+            with engine.begin() as conn:
+                pg_load.load_chunk(df_chunk, load_table, conn, load_method)
+            pbar.set_postfix(rows_per_sec=f'{len(df_chunk) / (time() - t0):,.0f}')
+
+    if partitioned:
+        pg_load.attach_partition(engine, load_table, target_table, year, month, parse_dates, url.rsplit('/', 1)[-1],
+                                 unlogged=staging)
+    elif staging:
+        pg_load.swap_in(engine, load_table, target_table, parse_dates)
 
 if __name__ == '__main__':
     run()
\ No newline at end of file
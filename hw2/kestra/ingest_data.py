@@ -1,11 +1,26 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import os
+import sys
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from time import time
+
 import click
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from tqdm.auto import tqdm
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+import pg_load  # noqa: E402
+
+try:
+    import tlc_cache
+except ImportError:  # copied out without tlc_cache.py; download every time
+    tlc_cache = None
+
 dtype = {
     "VendorID": "Int64",
     "passenger_count": "Int64",
@@ -30,6 +45,186 @@ parse_dates = [
     "tpep_dropoff_datetime"
 ]
 
+parse_dates_by_type = {
+    "yellow": parse_dates,
+    "green": ["lpep_pickup_datetime", "lpep_dropoff_datetime"],
+}
+
+prefix = 'https://github.com/DataTalksClub/nyc-tlc-data/releases/download'
+
+
+def parse_months(spec):
+    """Expand '2019-01..2021-07' (or a single '2019-01') into [(year, month), ...]."""
+    start, _, end = spec.partition('..')
+    try:
+        year, month = map(int, start.split('-'))
+        end_year, end_month = map(int, (end or start).split('-'))
+    except ValueError:
+        raise click.BadParameter(f'{spec!r} is not YYYY-MM or YYYY-MM..YYYY-MM', param_hint='--months')
+    if not (1 <= month <= 12 and 1 <= end_month <= 12):
+        raise click.BadParameter(f'{spec!r} has a month outside 01-12', param_hint='--months')
+    if (year, month) > (end_year, end_month):
+        raise click.BadParameter(f'{spec!r} ends before it starts', param_hint='--months')
+
+    months = []
+    while (year, month) <= (end_year, end_month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def source_url(taxi_type, year, month):
+    return f'{prefix}/{taxi_type}/{taxi_type}_tripdata_{year}-{month:02d}.csv.gz'
+
+
+def cached(url):
+    """Local copy of url from the shared download cache, or the URL itself without it."""
+    return tlc_cache.fetch(url) if tlc_cache else url
+
+
+def open_source(url):
+    """Binary handle on the (gzipped) source, and a version string identifying its content.
+
+    The version is the cache entry's checksum and size, or the server's ETag and
+    Content-Length when streaming straight from the URL.
+    """
+    source = cached(url)
+    if isinstance(source, Path):
+        meta = tlc_cache.cached_meta(url)
+        return open(source, 'rb'), f"sha256:{meta['sha256']}/{meta['size']}"
+    response = urllib.request.urlopen(source)
+    return response, f"etag:{response.headers.get('ETag')}/{response.headers.get('Content-Length')}"
+
+
+def read_chunks(handle, taxi_type, chunksize):
+    return pd.read_csv(
+        handle,
+        compression='gzip',
+        dtype=dtype,
+        parse_dates=parse_dates_by_type[taxi_type],
+        iterator=True,
+        chunksize=chunksize,
+    )
+
+
+# Added after the first release of the table; older checkpoint rows have NULLs and never match.
+checkpoint_columns = {'start_row': 'BIGINT', 'chunksize': 'INTEGER', 'source_version': 'TEXT'}
+
+
+def ensure_checkpoint_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+                target_table TEXT NOT NULL,
+                source_file TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                row_count INTEGER NOT NULL,
+                start_row BIGINT,
+                chunksize INTEGER,
+                source_version TEXT,
+                loaded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (target_table, source_file, chunk_index)
+            )
+        """))
+        existing = {c['name'] for c in inspect(conn).get_columns('ingest_checkpoints')}
+        for name, sql_type in checkpoint_columns.items():
+            if name not in existing:
+                conn.execute(text(f'ALTER TABLE ingest_checkpoints ADD COLUMN {name} {sql_type}'))
+
+
+def clear_checkpoints(engine, target_table):
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM ingest_checkpoints WHERE target_table = :t"), {'t': target_table})
+
+
+def completed_chunks(engine, target_table, source_file, chunksize, source_version):
+    """Indexes of the chunks already loaded from source_file.
+
+    A chunk index only names the same rows under the same chunksize and the same file
+    content, so checkpoints written under a different one are refused rather than
+    silently dropping or duplicating rows.
+    """
+    with engine.connect() as conn:
+        result = conn.execute(
+            text("""
+                SELECT chunk_index, start_row, chunksize, source_version FROM ingest_checkpoints
+                WHERE target_table = :t AND source_file = :f
+            """),
+            {'t': target_table, 'f': source_file},
+        )
+        rows = result.fetchall()
+
+    for row in rows:
+        if row.chunksize != chunksize or row.start_row != row.chunk_index * chunksize:
+            written_with = row.chunksize or 'an unknown chunksize'
+            raise click.ClickException(
+                f'{target_table} has checkpoints for {source_file} written with --chunksize {written_with}; '
+                f'resume with that chunksize or reload without --resume'
+            )
+        if row.source_version != source_version:
+            raise click.ClickException(
+                f'{source_file} changed since {target_table} was checkpointed '
+                f'({row.source_version} -> {source_version}); reload without --resume'
+            )
+    return {row.chunk_index for row in rows}
+
+
+def record_checkpoint(conn, target_table, source_file, chunk_index, row_count, start_row, chunksize,
+                      source_version):
+    conn.execute(
+        text("""
+            INSERT INTO ingest_checkpoints
+                (target_table, source_file, chunk_index, row_count, start_row, chunksize, source_version)
+            VALUES (:t, :f, :i, :n, :r, :c, :v)
+        """),
+        {'t': target_table, 'f': source_file, 'i': chunk_index, 'n': row_count, 'r': start_row,
+         'c': chunksize, 'v': source_version},
+    )
+
+
+def ingest_file(db_url, taxi_type, year, month, target_table, chunksize, load_method, progress=True,
+                create=False, unlogged=False, resume=False, compact=False):
+    """Append one monthly file to target_table, skipping chunks already checkpointed.
+
+    Runs inside a pool worker, so it opens its own engine instead of sharing the parent's.
+    Each chunk and its checkpoint row commit in one transaction, so a crash never leaves
+    a chunk loaded but unrecorded (or the other way round). With create=True the table
+    belongs to this file alone and is (re)created from its first chunk.
+    """
+    url = source_url(taxi_type, year, month)
+    source_file = url.rsplit('/', 1)[-1]
+    engine = create_engine(db_url)
+    create = create and not (resume and inspect(engine).has_table(target_table))
+    if create:
+        clear_checkpoints(engine, target_table)
+    rows = 0
+    start_row = 0
+
+    handle, source_version = open_source(url)
+    with handle:
+        done = completed_chunks(engine, target_table, source_file, chunksize, source_version)
+        # gzip streams cannot seek, so completed chunks are still parsed, just not loaded.
+        pbar = tqdm(read_chunks(handle, taxi_type, chunksize), disable=not progress)
+        for chunk_index, df_chunk in enumerate(pbar):
+            chunk_start, start_row = start_row, start_row + len(df_chunk)
+            if chunk_index in done:
+                continue
+            if compact:
+                df_chunk = pg_load.downcast(df_chunk)
+            if create and chunk_index == 0:
+                pg_load.create_table(df_chunk, target_table, engine, unlogged=unlogged)
+
+            t0 = time()
+            with engine.begin() as conn:
+                pg_load.load_chunk(df_chunk, target_table, conn, load_method)
+                record_checkpoint(conn, target_table, source_file, chunk_index, len(df_chunk), chunk_start,
+                                  chunksize, source_version)
+            rows += len(df_chunk)
+            pbar.set_postfix(rows_per_sec=f'{len(df_chunk) / (time() - t0):,.0f}')
+
+    engine.dispose()
+    return rows
+
 
 @click.command()
 @click.option('--pg_user', default='root', help='PostgreSQL user')
@@ -37,52 +232,94 @@ parse_dates = [
 @click.option('--pg_host', default='localhost', help='PostgreSQL host')
 @click.option('--pg_port', default=5432, type=int, help='PostgreSQL port')
 @click.option('--pg_db', default='ny_taxi', help='PostgreSQL database name')
+@click.option('--db_url', default=None, help='SQLAlchemy URL overriding the --pg_* options, e.g. sqlite:///bench.db')
 @click.option('--year', default=2021, type=int, help='Year of the data')
 @click.option('--month', default=1, type=int, help='Month of the data')
-@click.option('--target_table', default='yellow_taxi_data', help='Target table name')
+@click.option('--months', default=None, help='Month range, e.g. 2019-01..2021-07 (overrides --year/--month)')
+@click.option('--taxi_types', default='yellow', help='Comma-separated taxi types, e.g. yellow,green')
+@click.option('--target_table', default='yellow_taxi_data',
+              help="Target table name; use '{taxi_type}' in it when loading several taxi types")
 @click.option('--chunksize', default=100000, type=int, help='Chunk size for reading CSV')
-def run(pg_user, pg_pass, pg_host, pg_port, pg_db, year, month, target_table, chunksize):
+@click.option('--load_method', default='insert', type=click.Choice(['insert', 'copy']),
+              help='insert: DataFrame.to_sql, copy: COPY ... FROM STDIN')
+@click.option('--workers', default=None, type=int,
+              help='Worker processes, each with its own connection (default: one per CPU, capped by file count)')
+@click.option('--resume', is_flag=True, help='Keep the existing table and skip chunks already checkpointed')
+@click.option('--staging', is_flag=True,
+              help='Load into an UNLOGGED staging table, index it, then swap it in with one rename')
+@click.option('--partitioned', is_flag=True,
+              help='Attach each month as a partition of a table range-partitioned on pickup datetime')
+@click.option('--compact', is_flag=True, help='Downcast chunks to compact_dtype and create narrow columns')
+def run(pg_user, pg_pass, pg_host, pg_port, pg_db, db_url, year, month, months, taxi_types, target_table,
+        chunksize, load_method, workers, resume, staging, partitioned, compact):
     """Ingest NYC taxi data into PostgreSQL database."""
-   # prefix = 'https://github.com/DataTalksClub/nyc-tlc-data/releases/download/yellow'
-   # url = f'{prefix}/yellow_tripdata_{year}-{month:02d}.csv.gz'
-     #prefix = 'https://github.com/DataTalksClub/nyc-tlc-data/releases/download/yellow'
-  #   url = 'https://d37ci6vzurychx.cloudfront.net/trip-data/green_tripdata_2025-11.parquet'
-    prefix = 'https://github.com/DataTalksClub/nyc-tlc-data/releases/download/yellow'
-    url = f'{prefix}/yellow_tripdata_{year}-{month:02d}.csv.gz'
-
-    engine = create_engine(f'postgresql://{pg_user}:{pg_pass}@{pg_host}:{pg_port}/{pg_db}')
+    taxi_types = [t.strip() for t in taxi_types.split(',') if t.strip()]
+    if len(taxi_types) > 1 and '{taxi_type}' not in target_table:
+        raise click.BadParameter("must contain '{taxi_type}' when loading several taxi types",
+                                 param_hint='--target_table')
+    month_list = parse_months(months) if months else [(year, month)]
+    jobs = [(taxi_type, y, m) for taxi_type in taxi_types for y, m in month_list]
+    final_tables = {taxi_type: target_table.format(taxi_type=taxi_type) for taxi_type in taxi_types}
+    if partitioned:
+        # One load table per month, created by the worker that loads it.
+        load_tables = {(t, y, m): f'{final_tables[t]}_{y}_{m:02d}_load' for t, y, m in jobs}
+    else:
+        load_tables = {(t, y, m): f'{final_tables[t]}_staging' if staging else final_tables[t] for t, y, m in jobs}
+
+    db_url = db_url or f'postgresql://{pg_user}:{pg_pass}@{pg_host}:{pg_port}/{pg_db}'
+    engine = create_engine(db_url)
     #zones
     print("Ingesting taxi zone lookup data...")
     zones_url = "https://github.com/DataTalksClub/nyc-tlc-data/releases/download/misc/taxi_zone_lookup.csv"
-    df_zones = pd.read_csv(zones_url)
+    df_zones = pd.read_csv(cached(zones_url))
     df_zones.to_sql("taxi_zones", con=engine, if_exists="replace", index=False)
     print(f"Successfully ingested {len(df_zones)} taxi zones")
     #zones
 
-    df_iter = pd.read_csv(
-        url,
-        dtype=dtype,
-        parse_dates=parse_dates,
-        iterator=True,
-        chunksize=chunksize,
-    )
+    # Create each shared table once up front from the first file's header; workers only append.
+    ensure_checkpoint_table(engine)
+    first_year, first_month = month_list[0]
+    for taxi_type in taxi_types:
+        table = load_tables[taxi_type, first_year, first_month]
+        if partitioned or (resume and inspect(engine).has_table(table)):
+            continue
+        handle, _ = open_source(source_url(taxi_type, first_year, first_month))
+        with handle, read_chunks(handle, taxi_type, 1000) as reader:
+            header = next(reader)
+            pg_load.create_table(pg_load.downcast(header) if compact else header, table, engine, unlogged=staging)
+        clear_checkpoints(engine, table)
+    # Don't hand pooled connections to forked workers; the engine reconnects for the swap.
+    engine.dispose()
 
-    first = True
+    workers = workers or min(os.cpu_count() or 1, len(jobs))
+    if workers == 1:
+        for job in jobs:
+            ingest_file(db_url, *job, load_tables[job], chunksize, load_method,
+                        create=partitioned, unlogged=staging, resume=resume, compact=compact)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(ingest_file, db_url, *job, load_tables[job], chunksize, load_method, progress=False,
+                            create=partitioned, unlogged=staging, resume=resume, compact=compact): job
+                for job in jobs
+            }
+            for future in tqdm(as_completed(futures), total=len(futures), unit='file'):
+                taxi_type, y, m = futures[future]
+                tqdm.write(f'{taxi_type} {y}-{m:02d}: {future.result():,} rows')
 
-    for df_chunk in tqdm(df_iter):
-        if first:
-            df_chunk.head(0).to_sql(
-                name=target_table,
-                con=engine,
-                if_exists='replace'
-            )
-            first = False
-
-        df_chunk.to_sql(
-            name=target_table,
-            con=engine,
-            if_exists='append'
-        )
+    if partitioned:
+        for taxi_type, y, m in jobs:
+            table = load_tables[taxi_type, y, m]
+            source_file = source_url(taxi_type, y, m).rsplit('/', 1)[-1]
+            pg_load.attach_partition(engine, table, final_tables[taxi_type], y, m, parse_dates_by_type[taxi_type],
+                                     source_file, unlogged=staging)
+            clear_checkpoints(engine, table)
+    elif staging:
+        for taxi_type in taxi_types:
+            table = f'{final_tables[taxi_type]}_staging'
+            pg_load.swap_in(engine, table, final_tables[taxi_type], parse_dates_by_type[taxi_type])
+            clear_checkpoints(engine, table)
+    engine.dispose()
 
 if __name__ == '__main__':
     run()
\ No newline at end of file
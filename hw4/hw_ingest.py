@@ -1,43 +1,200 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import duckdb
 import requests
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+try:
+    import tlc_cache
+except ImportError:
+    tlc_cache = None
+
 
 BASE_URL = "https://github.com/DataTalksClub/nyc-tlc-data/releases/download/fhv"
+CHUNK_SIZE = 1 << 20
+
+# Column types of the raw fhv_tripdata source (hw4/staging/sources.yaml).
+FHV_SCHEMA = {
+    "dispatching_base_num": "VARCHAR",
+    "pickup_datetime": "TIMESTAMP",
+    "dropOff_datetime": "TIMESTAMP",
+    "PUlocationID": "INTEGER",
+    "DOlocationID": "INTEGER",
+    "SR_Flag": "VARCHAR",
+    "Affiliated_base_number": "VARCHAR",
+}
+# Hive-style partition columns added by the lake layout, see lake_path().
+PARTITION_SCHEMA = {"year": "INTEGER", "month": "INTEGER"}
+LAKE_DIR = Path("data") / "lake"
+# Rows per Parquet row group; files are sorted by pickup_datetime, so each group covers a narrow time range.
+ROW_GROUP_SIZE = 122_880
+
+def download(url, filepath):
+    response = requests.get(url, stream=True)
+    response.raise_for_status()
+
+    # Write next to the target and rename, so an interrupted run never leaves a file that looks complete.
+    part_path = filepath.with_name(filepath.name + ".part")
+    with open(part_path, 'wb') as f:
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            f.write(chunk)
+    part_path.replace(filepath)
+
+
+def fetch_month(data_dir, year, month):
+    """Return the local csv.gz for one month, downloading it if needed."""
+    filename = f"fhv_tripdata_{year}-{month:02d}.csv.gz"
+    filepath = data_dir / filename
+    url = f"{BASE_URL}/{filename}"
+
+    if tlc_cache:
+        # Only a HEAD request when the cached copy is still current.
+        return tlc_cache.fetch(url)
+    if filepath.exists():
+        print(f"Пропуск {filename} (уже существует)")
+        return filepath
+
+    print(f"Загрузка {filename} из {url}...")
+    download(url, filepath)
+    return filepath
+
+
+def lake_path(year, month, taxi_type="fhv"):
+    """Parquet location in the taxi_type=/year=/month= lake, so readers can skip whole months by path."""
+    return (LAKE_DIR / f"taxi_type={taxi_type}" / f"year={year}" / f"month={month:02d}"
+            / f"{taxi_type}_tripdata_{year}-{month:02d}.parquet")
+
+
+def read_lake(paths):
+    hive_types = ", ".join(f"'{name}': '{type_}'" for name, type_ in PARTITION_SCHEMA.items())
+    return f"read_parquet({paths}, hive_partitioning=true, hive_types={{{hive_types}}}, filename=true)"
+
+
+def has_fhv_schema(con, parquet_path):
+    try:
+        columns = con.execute(
+            f"DESCRIBE SELECT * FROM read_parquet('{parquet_path}', hive_partitioning=false)"
+        ).fetchall()
+    except duckdb.Error:
+        return False
+    return {name: type_ for name, type_, *_ in columns} == FHV_SCHEMA
+
+
+def convert(con, filepath, parquet_path):
+    if (parquet_path.exists() and parquet_path.stat().st_mtime >= filepath.stat().st_mtime
+            and has_fhv_schema(con, parquet_path)):
+        print(f"Пропуск {filepath.name} (уже сконвертирован)")
+        return
+
+    print(f"Конвертация {filepath.name} в Parquet...")
+    parquet_path.parent.mkdir(parents=True, exist_ok=True)
+    columns = ", ".join(f"'{name}': '{type_}'" for name, type_ in FHV_SCHEMA.items())
+    con.execute(f"""
+        COPY (
+            SELECT * FROM read_csv('{filepath}', header=true, columns={{{columns}}})
+            ORDER BY pickup_datetime
+        )
+        TO '{parquet_path}' (FORMAT PARQUET, COMPRESSION ZSTD, ROW_GROUP_SIZE {ROW_GROUP_SIZE})
+    """)
 
-def download_and_convert_files():
-    data_dir = Path("data") / "fhv"
-    data_dir.mkdir(exist_ok=True, parents=True)
+    print(f"Файл {filepath.name} успешно обработан.")
 
-    year = 2019
-    for month in range(1, 13):
-        filename = f"fhv_tripdata_{year}-{month:02d}.csv.gz"
-        filepath = data_dir / filename
 
-        if filepath.exists():
-            print(f"Пропуск {filename} (уже существует)")
-            continue
+def download_and_convert_files(year=2019, workers=4, threads=None):
+    """Download the year's FHV months on `workers` threads and convert each one as soon as it lands.
 
-        url = f"{BASE_URL}/{filename}"
+    Conversion runs on this thread through a single DuckDB connection limited to
+    `threads` threads, so it overlaps with the downloads still in flight.
+    """
+    data_dir = Path("data") / "fhv"
+    data_dir.mkdir(exist_ok=True, parents=True)
 
-        print(f"Загрузка {filename} из {url}...")
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
+    con = duckdb.connect()
+    con.execute(f"SET threads = {threads or os.cpu_count()}")
 
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(fetch_month, data_dir, year, month): month for month in range(1, 13)}
+            for future in as_completed(futures):
+                month = futures[future]
+                convert(con, future.result(), lake_path(year, month))
+    finally:
+        con.close()
 
-        with open(filepath, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+def parquet_list(paths):
+    return "[" + ", ".join(f"'{path}'" for path in paths) + "]"
 
-        print(f"Конвертация {filename} в Parquet...")
-        con = duckdb.connect()
-        con.execute(f"""
-            COPY (SELECT * FROM read_csv_auto('{filepath}'))
-            TO 'data/fhv/fhv_tripdata_{year}-{month:02d}.parquet' (FORMAT PARQUET)
-        """)
-        con.close()
 
-        print(f"Файл {filename} успешно обработан.")
+def load_fhv_tripdata(con, data_dir, full_refresh=False):
+    """Bring prod.fhv_tripdata in line with the year=/month= Parquet files under data_dir.
+
+    prod.fhv_tripdata_files records the path, size, mtime and row count of every
+    file already loaded. Rows keep the file they came from in `filename`, so a
+    new or changed month is (re)inserted on its own and the others are left alone.
+    """
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS prod.fhv_tripdata_files (
+            path VARCHAR PRIMARY KEY,
+            size BIGINT,
+            mtime DOUBLE,
+            row_count BIGINT,
+            loaded_at TIMESTAMP DEFAULT current_timestamp
+        )
+    """)
+    columns = dict(con.execute("""
+        SELECT column_name, data_type FROM information_schema.columns
+        WHERE table_schema = 'prod' AND table_name = 'fhv_tripdata'
+        ORDER BY ordinal_position
+    """).fetchall())
+    table_schema = {**FHV_SCHEMA, **PARTITION_SCHEMA, "filename": "VARCHAR"}
+    if full_refresh or columns != table_schema:
+        # Missing, or built before the manifest, the declared schema or the lake layout: start over.
+        con.execute("DROP TABLE IF EXISTS prod.fhv_tripdata")
+        con.execute("DELETE FROM prod.fhv_tripdata_files")
+        table_columns = ", ".join(f"{name} {type_}" for name, type_ in table_schema.items())
+        con.execute(f"CREATE TABLE prod.fhv_tripdata ({table_columns})")
+
+    loaded = {path: (size, mtime) for path, size, mtime in
+              con.execute("SELECT path, size, mtime FROM prod.fhv_tripdata_files").fetchall()}
+    on_disk = {}
+    for path in sorted(data_dir.glob("year=*/month=*/*.parquet")):
+        stat = path.stat()
+        on_disk[str(path)] = (stat.st_size, stat.st_mtime)
+
+    changed = [path for path, version in on_disk.items() if loaded.get(path) != version]
+    stale = [path for path in loaded if path not in on_disk or path in changed]
+    if not changed and not stale:
+        print("prod.fhv_tripdata уже актуальна")
+        return
+
+    con.begin()
+    try:
+        if stale:
+            con.execute(f"DELETE FROM prod.fhv_tripdata WHERE filename IN (SELECT unnest({parquet_list(stale)}))")
+            con.execute(f"DELETE FROM prod.fhv_tripdata_files WHERE path IN (SELECT unnest({parquet_list(stale)}))")
+        if changed:
+            con.execute(f"""
+                INSERT INTO prod.fhv_tripdata BY NAME
+                SELECT * EXCLUDE (taxi_type) FROM {read_lake(parquet_list(changed))}
+            """)
+            counts = dict(con.execute(f"""
+                SELECT filename, count(*) FROM prod.fhv_tripdata
+                WHERE filename IN (SELECT unnest({parquet_list(changed)}))
+                GROUP BY filename
+            """).fetchall())
+            con.executemany(
+                "INSERT INTO prod.fhv_tripdata_files (path, size, mtime, row_count) VALUES (?, ?, ?, ?)",
+                [[path, *on_disk[path], counts.get(path, 0)] for path in changed],
+            )
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+
+    print(f"prod.fhv_tripdata: загружено {len(changed)}, удалено {len(stale)} файлов")
 
 def update_gitignore():
     gitignore_path = Path(".gitignore")
@@ -48,19 +205,25 @@ def update_gitignore():
             f.write('\n# Data directory\n/data/\n' if content else '# Data directory\n/data/\n')
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load FHV trip data into taxi_rides_ny.duckdb")
+    parser.add_argument("--year", type=int, default=2019, help="Year of the FHV data")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Months downloaded concurrently (1 = one after another)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="DuckDB threads for the CSV to Parquet conversion (default: all cores)")
+    parser.add_argument("--full_refresh", action="store_true",
+                        help="Rebuild prod.fhv_tripdata from every Parquet file instead of only new or changed ones")
+    args = parser.parse_args()
 
     update_gitignore()
 
-    download_and_convert_files()
+    download_and_convert_files(args.year, args.workers, args.threads)
 
     con = duckdb.connect("taxi_rides_ny.duckdb")
     con.execute("CREATE SCHEMA IF NOT EXISTS prod")
 
 
-    con.execute("""
-        CREATE OR REPLACE TABLE prod.fhv_tripdata AS
-        SELECT * FROM read_parquet('data/fhv/*.parquet', union_by_name=true)
-    """)
+    load_fhv_tripdata(con, LAKE_DIR / "taxi_type=fhv", full_refresh=args.full_refresh)
 
 
     con.close()
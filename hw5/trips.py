@@ -3,10 +3,26 @@ name: ingestion.trips
 type: python
 image: python:3.11
 connection: duckdb-default
+description: |
+  NYC TLC trip records, one parquet file per taxi type and month, normalized to the columns below.
+
+  Runs load whole calendar months: every month that BRUIN_START_DATE..BRUIN_END_DATE touches is
+  loaded in full, even when the window starts or ends mid-month, and rows outside the file's month
+  are dropped. delete+insert on source_file replaces a file's rows as a unit, so a partial month
+  would delete the rest of it.
+
+  With the `incremental` var, files already in this table with the ETag the server still reports
+  (source_etag) are skipped; --full-refresh loads them all again.
+
+secrets:
+  # Incremental runs read the loaded ETags from the same database the asset writes to.
+  - key: duckdb-default
+    inject_as: DUCKDB_DEFAULT
 
 materialization:
   type: table
-  strategy: append
+  strategy: delete+insert
+  incremental_key: source_file
 
 columns:
   - name: pickup_datetime
@@ -30,16 +46,35 @@ columns:
   - name: payment_type
     type: integer
     description: "Payment type ID (joined with payment_lookup)"
+  - name: source_file
+    type: string
+    description: "TLC file the row came from; each run replaces the rows of the files it loads"
+  - name: source_etag
+    type: string
+    description: "ETag of source_file when it was loaded; incremental runs skip files whose ETag is unchanged"
 @bruin"""
 
 import io
 import os
+import sys
 import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from pathlib import Path
 from dateutil.relativedelta import relativedelta
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import requests
+from requests.adapters import HTTPAdapter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+try:
+    import tlc_cache
+except ImportError:  # asset deployed without the repo root
+    tlc_cache = None
 
 BASE_URL = "https://d37ci6vzurychx.cloudfront.net/trip-data"
 
@@ -49,68 +84,221 @@ DATETIME_COLS = {
     "green": ("lpep_pickup_datetime", "lpep_dropoff_datetime"),
 }
 
+COLUMNS = [
+    "pickup_datetime",
+    "dropoff_datetime",
+    "pickup_location_id",
+    "dropoff_location_id",
+    "fare_amount",
+    "taxi_type",
+    "payment_type",
+    "source_file",
+    "source_etag",
+]
+
+# (month, taxi type) files downloaded at once; also the number of months held in memory.
+DEFAULT_WORKERS = 4
+
+
+def remote_etag(session, url):
+    """ETag the server currently reports for url, or None if it can't be had.
+
+    `session` is only used without tlc_cache (see fetch).
+    """
+    try:
+        if tlc_cache:
+            return tlc_cache.remote_version(url)[0]
+        resp = session.head(url, allow_redirects=True, timeout=60)
+        resp.raise_for_status()
+        return resp.headers.get("ETag")
+    except (requests.RequestException, OSError):
+        return None
+
+
+def destination_path():
+    """Database file of the asset's connection, from the secret Bruin injects as DUCKDB_DEFAULT."""
+    try:
+        return json.loads(os.environ["DUCKDB_DEFAULT"])["path"]
+    except (KeyError, ValueError) as exc:
+        raise RuntimeError(
+            "incremental needs the duckdb-default connection injected as DUCKDB_DEFAULT (see secrets above)"
+        ) from exc
+
+
+def loaded_etags(db_path):
+    """{source_file: source_etag} of the files already in the destination table.
+
+    Read from the table Bruin writes rather than kept on the side, so a month only
+    counts as loaded once the write that carried it has committed.
+    """
+    import duckdb  # only incremental runs need it
+
+    if not Path(db_path).exists():
+        return {}
+    try:
+        con = duckdb.connect(str(db_path), read_only=True)
+    except duckdb.IOException as exc:
+        # Typically another process holding the write lock.
+        raise RuntimeError(
+            f"incremental can't read the loaded files from {db_path}: {exc}. "
+            "Rerun once nothing else has it open, or without incremental."
+        ) from exc
+    with con:
+        try:
+            rows = con.execute(
+                "SELECT source_file, any_value(source_etag) FROM ingestion.trips GROUP BY source_file"
+            ).fetchall()
+        except (duckdb.CatalogException, duckdb.BinderException):
+            # First run, or a table from before source_etag: everything gets loaded.
+            return {}
+    return dict(rows)
+
+
+def fetch(url, session=requests):
+    """Local copy from the shared download cache, or the response body without it.
+
+    Downloads go through tlc_cache whenever it is importable, so re-runs reuse the
+    files; it uses urllib, and `session` only carries requests without it.
+    """
+    if tlc_cache:
+        return tlc_cache.fetch(url)
+    resp = session.get(url, timeout=60)
+    resp.raise_for_status()
+    return io.BytesIO(resp.content)
+
+
+def load_month(session, taxi_type, year, month, loaded=None):
+    """One month of one taxi type as an Arrow table, normalized to COLUMNS.
+
+    Returns None if the file is missing or empty, or if `loaded` (see loaded_etags)
+    already has it with the ETag the server reports.
+    """
+    filename = f"{taxi_type}_tripdata_{year}-{month:02d}.parquet"
+    url = f"{BASE_URL}/{filename}"
+    etag = None
+    if loaded is not None:
+        etag = remote_etag(session, url)
+        if etag is not None and loaded.get(filename) == etag:
+            return None
+    try:
+        source = fetch(url, session)
+    except (requests.RequestException, OSError):
+        return None
+    if etag is None and tlc_cache:
+        # Recorded with the download, so non-incremental loads still leave an ETag to compare against.
+        etag = (tlc_cache.cached_meta(url) or {}).get("etag")
+
+    pickup_col, dropoff_col = DATETIME_COLS.get(
+        taxi_type, ("tpep_pickup_datetime", "tpep_dropoff_datetime")
+    )
+    # Normalize to schema expected by staging
+    rename = {
+        pickup_col: "pickup_datetime",
+        dropoff_col: "dropoff_datetime",
+        "PULocationID": "pickup_location_id",
+        "DOLocationID": "dropoff_location_id",
+    }
+    # Only decode the columns we keep, and let row-group min/max statistics skip groups
+    # whose pickups fall outside the month; stray out-of-month rows are dropped too.
+    # The whole month is kept because delete+insert replaces the file's rows as a unit.
+    start = datetime(year, month, 1)
+    end = start + relativedelta(months=1)
+    wanted = [*rename, "fare_amount", "payment_type"]
+    names = pq.read_schema(source).names
+    table = pq.read_table(
+        source,
+        columns=[c for c in wanted if c in names],
+        filters=[(pickup_col, ">=", start), (pickup_col, "<", end)],
+    )
+    if table.num_rows == 0:
+        return None
+    table = table.rename_columns([rename.get(c, c) for c in table.column_names])
+    # Plain strings, not dictionary arrays: pandas would turn those into categoricals and
+    # DuckDB into ENUMs, neither of which matches the declared string columns.
+    table = table.append_column("taxi_type", pa.repeat(pa.scalar(taxi_type, pa.string()), table.num_rows))
+    table = table.append_column("source_file", pa.repeat(pa.scalar(filename, pa.string()), table.num_rows))
+    table = table.append_column("source_etag", pa.repeat(pa.scalar(etag, pa.string()), table.num_rows))
+    # Keep only columns that exist
+    return table.select([c for c in COLUMNS if c in table.column_names])
+
+
+def iter_months(start_date, end_date, taxi_types, workers=DEFAULT_WORKERS, loaded=None):
+    """Yield one Arrow table per (month, taxi type), in order, fetching up to `workers` files concurrently.
+
+    With `loaded`, months already in the destination with the same ETag are skipped.
+    """
+    jobs = []
+    # Whole months: the first of the start month, so a window ending mid-month still gets its last month.
+    current = start_date.replace(day=1)
+    while current <= end_date:
+        jobs.extend((taxi_type, current.year, current.month) for taxi_type in taxi_types)
+        current += relativedelta(months=1)
+
+    session = requests.Session()
+    if tlc_cache is None:
+        # One keep-alive connection per worker for the downloads.
+        session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+    with session, ThreadPoolExecutor(max_workers=workers) as pool:
+        # A sliding window instead of submitting everything: finished months wait here
+        # until yielded, so at most `workers` of them are in memory at a time.
+        pending = deque()
+        for job in jobs:
+            pending.append(pool.submit(load_month, session, *job, loaded))
+            if len(pending) < workers:
+                continue
+            yield from _consume(pending.popleft())
+        while pending:
+            yield from _consume(pending.popleft())
+
+
+def _consume(future):
+    table = future.result()
+    if table is not None:
+        yield table
+
 
 def materialize():
     start_date_str = os.environ["BRUIN_START_DATE"]
     end_date_str = os.environ["BRUIN_END_DATE"]
     vars_str = os.environ.get("BRUIN_VARS", "{}")
-    taxi_types = json.loads(vars_str).get("taxi_types", ["yellow"])
+    bruin_vars = json.loads(vars_str)
+    taxi_types = bruin_vars.get("taxi_types", ["yellow"])
+    workers = int(bruin_vars.get("workers", DEFAULT_WORKERS))
 
     start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
     end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
 
-    frames = []
-    current = start_date
-    while current <= end_date:
-        year, month = current.year, current.month
-        for taxi_type in taxi_types:
-            filename = f"{taxi_type}_tripdata_{year}-{month:02d}.parquet"
-            url = f"{BASE_URL}/{filename}"
-            try:
-                resp = requests.get(url, timeout=60)
-                resp.raise_for_status()
-            except requests.RequestException:
-                continue
-            df = pd.read_parquet(io.BytesIO(resp.content))
-            if df.empty:
-                continue
-            pickup_col, dropoff_col = DATETIME_COLS.get(
-                taxi_type, ("tpep_pickup_datetime", "tpep_dropoff_datetime")
-            )
-            # Normalize to schema expected by staging
-            rename = {
-                pickup_col: "pickup_datetime",
-                dropoff_col: "dropoff_datetime",
-                "PULocationID": "pickup_location_id",
-                "DOLocationID": "dropoff_location_id",
-            }
-            df = df.rename(columns=rename)
-            df["taxi_type"] = taxi_type
-            needed = [
-                "pickup_datetime",
-                "dropoff_datetime",
-                "pickup_location_id",
-                "dropoff_location_id",
-                "fare_amount",
-                "taxi_type",
-                "payment_type",
-            ]
-            # Keep only columns that exist
-            existing = [c for c in needed if c in df.columns]
-            frames.append(df[existing])
-        current += relativedelta(months=1)
+    # Incremental mode: skip months already materialized from the same source ETag.
+    loaded = None
+    if bruin_vars.get("incremental", False):
+        full_refresh = os.environ.get("BRUIN_FULL_REFRESH", "") not in ("", "0", "false")
+        loaded = {} if full_refresh else loaded_etags(destination_path())
+
+    # Arrow mode hands Bruin the tables as read, which DuckDB ingests without a pandas copy.
+    arrow = bruin_vars.get("arrow", False)
+
+    tables = iter_months(start_date, end_date, taxi_types, workers, loaded)
+    if bruin_vars.get("stream", True):
+        # Bruin appends each yielded frame as it arrives, so only `workers` months are ever in memory.
+        return _stream(tables, arrow)
+
+    # stream: false returns one frame for the whole interval.
+    tables = [_with_all_columns(t) for t in tables]
+    if not tables:
+        return pa.table({c: pa.nulls(0) for c in COLUMNS}) if arrow else pd.DataFrame(columns=COLUMNS)
+    # Months can disagree on numeric widths (e.g. int64 vs double payment_type). The Arrow concat
+    # only collects chunks, so the pandas path copies the interval once, not once per month plus once.
+    result = pa.concat_tables(tables, promote_options="permissive")
+    return result if arrow else result.to_pandas()
+
+
+def _with_all_columns(table):
+    for name in COLUMNS:
+        if name not in table.column_names:
+            table = table.append_column(name, pa.nulls(table.num_rows))
+    return table.select(COLUMNS)
+
 
-    if not frames:
-        return pd.DataFrame(
-            columns=[
-                "pickup_datetime",
-                "dropoff_datetime",
-                "pickup_location_id",
-                "dropoff_location_id",
-                "fare_amount",
-                "taxi_type",
-                "payment_type",
-            ]
-        )
-    result = pd.concat(frames, ignore_index=True)
-    return result[["pickup_datetime", "dropoff_datetime", "pickup_location_id", "dropoff_location_id", "fare_amount", "taxi_type", "payment_type"]]
+def _stream(tables, arrow):
+    for table in tables:
+        yield _with_all_columns(table) if arrow else table.to_pandas().reindex(columns=COLUMNS)
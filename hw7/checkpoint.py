@@ -0,0 +1,158 @@
+"""Checkpointed per-partition state for Kafka consumers.
+
+A consumer that aggregates in memory and lets Kafka commit offsets on its own
+double counts after a crash: the offsets and the counts it had reached are
+saved at different moments. Here both are saved together instead. Each
+(job, topic, partition) gets one row in a local SQLite file holding the next
+offset to read and the partition's aggregate state as JSON. All partitions
+a worker owns are written in a single transaction.
+
+On assignment the consumer loads those rows and seeks to the stored offsets,
+so a restart resumes where the last checkpoint left off. It replays at most
+`checkpoint_interval` seconds of messages and never counts one twice. Kafka's
+own committed offsets are still updated after every checkpoint, but only so
+that lag shows up in `rpk group describe`; they are never read back.
+
+State is kept per partition rather than per worker. When a rebalance moves a
+partition to another worker, its counts move with it. The job's result is the
+merge of every partition's state (see CheckpointStore.states).
+"""
+import json
+import sqlite3
+from time import monotonic
+
+from kafka import ConsumerRebalanceListener
+
+
+class CheckpointStore:
+    """SQLite table of (next_offset, state) per partition, shared by a job's worker processes."""
+
+    def __init__(self, path, job):
+        self.job = job
+        # WAL lets one worker read while another checkpoints; the timeout waits out concurrent writers.
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                job TEXT NOT NULL,
+                topic TEXT NOT NULL,
+                partition INTEGER NOT NULL,
+                next_offset INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (job, topic, partition)
+            )
+        """)
+
+    def load(self, topic, partitions):
+        """{partition: (next_offset, state)} for the given partitions that have a checkpoint."""
+        placeholders = ', '.join('?' * len(partitions))
+        rows = self.conn.execute(
+            f"SELECT partition, next_offset, state FROM checkpoints "
+            f"WHERE job = ? AND topic = ? AND partition IN ({placeholders})",
+            [self.job, topic, *partitions],
+        )
+        return {partition: (next_offset, json.loads(state)) for partition, next_offset, state in rows}
+
+    def save(self, topic, snapshots):
+        """Write {partition: (next_offset, state)} atomically: all partitions or none."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(
+                "INSERT INTO checkpoints (job, topic, partition, next_offset, state) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (job, topic, partition) DO UPDATE SET "
+                "next_offset = excluded.next_offset, state = excluded.state, updated_at = CURRENT_TIMESTAMP",
+                [(self.job, topic, partition, next_offset, json.dumps(state))
+                 for partition, (next_offset, state) in snapshots.items()],
+            )
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def states(self, topic):
+        """Every partition's latest state, to be merged into the job's result."""
+        rows = self.conn.execute(
+            "SELECT state FROM checkpoints WHERE job = ? AND topic = ? ORDER BY partition", [self.job, topic]
+        )
+        return [json.loads(state) for state, in rows]
+
+    def reset(self, topic):
+        self.conn.execute("DELETE FROM checkpoints WHERE job = ? AND topic = ?", [self.job, topic])
+
+    def close(self):
+        self.conn.close()
+
+
+class StatefulConsumer(ConsumerRebalanceListener):
+    """Runs `update(state, messages)` per polled partition batch and checkpoints state with offsets.
+
+    `consumer` must be created without topics and with enable_auto_commit=False;
+    `initial_state()` returns the state for a partition with no checkpoint yet.
+    """
+
+    def __init__(self, consumer, topic, store, initial_state, checkpoint_interval=5.0):
+        self.consumer = consumer
+        self.topic = topic
+        self.store = store
+        self.initial_state = initial_state
+        self.checkpoint_interval = checkpoint_interval
+        self.offsets = {}
+        self.states = {}
+
+    # --- rebalance callbacks, called from inside poll() ----------------------
+
+    def on_partitions_revoked(self, revoked):
+        self.checkpoint([tp.partition for tp in revoked])
+        for tp in revoked:
+            self.offsets.pop(tp.partition, None)
+            self.states.pop(tp.partition, None)
+
+    def on_partitions_assigned(self, assigned):
+        if not assigned:
+            return
+        saved = self.store.load(self.topic, [tp.partition for tp in assigned])
+        for tp in assigned:
+            if tp.partition in saved:
+                next_offset, state = saved[tp.partition]
+                self.consumer.seek(tp, next_offset)
+            else:
+                # Whatever Kafka has committed for the group does not match a state we hold.
+                next_offset, state = None, self.initial_state()
+                self.consumer.seek_to_beginning(tp)
+            self.offsets[tp.partition] = next_offset
+            self.states[tp.partition] = state
+
+    # --- running ---------------------------------------------------------------
+
+    def checkpoint(self, partitions=None):
+        partitions = self.states if partitions is None else partitions
+        snapshots = {
+            partition: (self.offsets[partition], self.states[partition])
+            for partition in partitions
+            if self.offsets.get(partition) is not None
+        }
+        if not snapshots:
+            return
+        self.store.save(self.topic, snapshots)
+        # Only after the store has them, and only for lag reporting.
+        self.consumer.commit()
+
+    def run(self, update, max_records=5000, idle_timeout=10.0):
+        """Consume until nothing arrives for idle_timeout seconds; always ends with a checkpoint."""
+        self.consumer.subscribe([self.topic], listener=self)
+        last_record = last_checkpoint = monotonic()
+        try:
+            while monotonic() - last_record < idle_timeout:
+                batches = self.consumer.poll(timeout_ms=1000, max_records=max_records)
+                for tp, messages in batches.items():
+                    update(self.states[tp.partition], messages)
+                    self.offsets[tp.partition] = messages[-1].offset + 1
+                    last_record = monotonic()
+                if monotonic() - last_checkpoint >= self.checkpoint_interval:
+                    self.checkpoint()
+                    last_checkpoint = monotonic()
+            self.checkpoint()
+        finally:
+            # Leaving the group without a final revoke callback, so the checkpoint above is the last word.
+            self.consumer.close(autocommit=False)
@@ -0,0 +1,35 @@
+"""Source format, parallelism and aggregation settings shared by the PyFlink window jobs (q4-q6).
+
+The window aggregations scale with the green-trips partitions when --parallelism
+matches them. TWO_PHASE pre-aggregates per subtask before the shuffle, which
+helps most for q6's single global hourly window. Mini-batch buffers input for
+the non-window aggregations. --format is the green-trips encoding the jobs pass
+to trip_wire.flink_source_format.
+"""
+
+
+def add_job_options(parser):
+    """--format, --parallelism, mini-batch and aggregation-phase options shared by the window jobs."""
+    parser.add_argument('--format', choices=['json', 'avro'], default='json',
+                        help="Encoding of the green-trips messages (avro needs the avro-confluent format jar)")
+    parser.add_argument('--parallelism', type=int, default=1,
+                        help="Job parallelism; up to the number of green-trips partitions is useful")
+    parser.add_argument('--mini_batch_latency', default=None,
+                        help="Enable mini-batch aggregation with this allowed latency, e.g. '1 s' (default: off)")
+    parser.add_argument('--mini_batch_size', type=int, default=5000, help="Records buffered per mini-batch")
+    parser.add_argument('--agg_phase', choices=['AUTO', 'ONE_PHASE', 'TWO_PHASE'], default='AUTO',
+                        help="table.optimizer.agg-phase-strategy; TWO_PHASE pre-aggregates before the shuffle")
+
+
+def configure_job(env, t_env, args):
+    """Apply add_job_options' settings to the job before any table is defined."""
+    env.set_parallelism(args.parallelism)
+    config = t_env.get_config()
+    if args.parallelism > 1:
+        # Subtasks beyond the topic's partitions read nothing and would hold back the watermark.
+        config.set('table.exec.source.idle-timeout', '10 s')
+    if args.mini_batch_latency:
+        config.set('table.exec.mini-batch.enabled', 'true')
+        config.set('table.exec.mini-batch.allow-latency', args.mini_batch_latency)
+        config.set('table.exec.mini-batch.size', str(args.mini_batch_size))
+    config.set('table.optimizer.agg-phase-strategy', args.agg_phase)
@@ -1,12 +1,41 @@
+import argparse
+import sys
+from pathlib import Path
 import pandas as pd
 import json
 from kafka import KafkaProducer
+from kafka.admin import KafkaAdminClient, NewTopic
+from kafka.errors import TopicAlreadyExistsError
 from time import time
 import logging
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+try:
+    import tlc_cache
+except ImportError:
+    tlc_cache = None
+
+import trip_wire
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+parser = argparse.ArgumentParser(description="Send the green taxi trips to Redpanda")
+parser.add_argument('--mode', choices=['bulk', 'rows'], default='bulk',
+                    help="bulk: serialize the whole frame column-wise up front; rows: one row at a time")
+parser.add_argument('--linger_ms', type=int, default=10, help="Producer wait for a batch to fill")
+parser.add_argument('--batch_size', type=int, default=256 * 1024, help="Producer batch size in bytes")
+parser.add_argument('--format', choices=['json', 'avro'], default='json',
+                    help="Message encoding; avro registers the schema and uses Confluent framing (see trip_wire.py)")
+parser.add_argument('--registry_url', default=trip_wire.REGISTRY_URL, help="Schema registry for --format avro")
+parser.add_argument('--compression', choices=['none', 'gzip', 'snappy', 'lz4', 'zstd'], default='none',
+                    help="Producer batch compression")
+parser.add_argument('--partitions', type=int, default=None,
+                    help="Create the topic with this many partitions if it does not exist (one per q3 --workers)")
+args = parser.parse_args()
+if args.mode == 'rows' and args.format != 'json':
+    parser.error("--mode rows is the original JSON path; use --mode bulk for --format avro")
+
 url = "https://d37ci6vzurychx.cloudfront.net/trip-data/green_tripdata_2025-10.parquet"
 columns_of_interest = [
     'lpep_pickup_datetime',
@@ -20,9 +49,24 @@ columns_of_interest = [
 ]
 
 logger.info(f"Loading data from {url}...")
-df = pd.read_parquet(url, columns=columns_of_interest)
+df = pd.read_parquet(tlc_cache.fetch(url) if tlc_cache else url, columns=columns_of_interest)
 logger.info(f"Loaded {len(df)} records.")
 
+def serialize_frame(df):
+    """JSON payloads for every row, formatted column-wise instead of per row (same fields as row_to_dict)."""
+    out = pd.DataFrame({
+        'lpep_pickup_datetime': df['lpep_pickup_datetime'].dt.strftime('%Y-%m-%d %H:%M:%S'),
+        'lpep_dropoff_datetime': df['lpep_dropoff_datetime'].dt.strftime('%Y-%m-%d %H:%M:%S'),
+        'PULocationID': df['PULocationID'].astype('int64'),
+        'DOLocationID': df['DOLocationID'].astype('int64'),
+        'passenger_count': df['passenger_count'].fillna(0).astype('int64'),
+        'trip_distance': df['trip_distance'].astype('float64'),
+        'tip_amount': df['tip_amount'].astype('float64'),
+        'total_amount': df['total_amount'].astype('float64'),
+    })
+    lines = out.to_json(orient='records', lines=True, double_precision=15).splitlines()
+    return [line.encode('utf-8') for line in lines]
+
 def row_to_dict(row):
     return {
         'lpep_pickup_datetime': row['lpep_pickup_datetime'].strftime('%Y-%m-%d %H:%M:%S'),
@@ -41,29 +85,65 @@ topic_name = 'green-trips'
 def json_serializer(data):
     return json.dumps(data).encode('utf-8')
 
+if args.partitions:
+    admin = KafkaAdminClient(bootstrap_servers=[bootstrap_server])
+    try:
+        admin.create_topics([NewTopic(topic_name, num_partitions=args.partitions, replication_factor=1)])
+        logger.info(f"Created topic '{topic_name}' with {args.partitions} partitions.")
+    except TopicAlreadyExistsError:
+        logger.info(f"Topic '{topic_name}' already exists; keeping its partitions.")
+    finally:
+        admin.close()
+
 producer = KafkaProducer(
     bootstrap_servers=[bootstrap_server],
-    value_serializer=json_serializer,
+    linger_ms=args.linger_ms,
+    batch_size=args.batch_size,
+    compression_type=None if args.compression == 'none' else args.compression,
 )
 
 logger.info(f"Connecting to {bootstrap_server}...")
 
 logger.info(f"Starting to send {len(df)} messages to topic '{topic_name}'...")
 t0 = time()
+sent_bytes = 0
 
-for index, row in df.iterrows():
-    try:
-        message_dict = row_to_dict(row)
-        future = producer.send(topic_name, value=message_dict)
-        if index % 1000 == 0 and index > 0:
-            logger.info(f"Sent {index} records...")
-    except Exception as e:
-        logger.error(f"Error sending record {index}: {e}")
+if args.mode == 'bulk':
+    if args.format == 'avro':
+        encoder = trip_wire.AvroEncoder(trip_wire.register_schema(topic_name, args.registry_url))
+        payloads = encoder.encode_frame(df)
+    else:
+        payloads = serialize_frame(df)
+    # Keyed by pickup zone so trips spread over the partitions and each zone stays in order.
+    keys = [str(pu).encode('utf-8') for pu in df['PULocationID'].astype('int64').tolist()]
+    logger.info(f"Serialized {len(payloads)} records in {time() - t0:.2f} seconds.")
+    for index, (key, payload) in enumerate(zip(keys, payloads)):
+        try:
+            producer.send(topic_name, key=key, value=payload)
+            sent_bytes += len(payload)
+            if index % 10000 == 0 and index > 0:
+                logger.info(f"Sent {index} records...")
+        except Exception as e:
+            logger.error(f"Error sending record {index}: {e}")
+else:
+    for index, row in df.iterrows():
+        try:
+            message_dict = row_to_dict(row)
+            payload = json_serializer(message_dict)
+            key = str(message_dict['PULocationID']).encode('utf-8')
+            future = producer.send(topic_name, key=key, value=payload)
+            sent_bytes += len(payload)
+            if index % 1000 == 0 and index > 0:
+                logger.info(f"Sent {index} records...")
+        except Exception as e:
+            logger.error(f"Error sending record {index}: {e}")
 
 producer.flush()
 t1 = time()
 
 logger.info("Sending completed.")
-print(f'\nData sending time: {(t1 - t0):.2f} seconds')
+elapsed = t1 - t0
+print(f'\nData sending time: {elapsed:.2f} seconds')
+print(f'Throughput: {len(df) / elapsed:,.0f} msgs/sec, {sent_bytes / elapsed / 1024**2:.2f} MB/sec')
 
 producer.close()
\ No newline at end of file
@@ -1,40 +1,90 @@
+import argparse
+import io
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-import json
+
+import pandas as pd
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from kafka import KafkaConsumer
 
+import trip_wire
+from checkpoint import CheckpointStore, StatefulConsumer
+
 server = 'localhost:9092'
 topic_name = 'green-trips'
+group_id = 'q3-consumer'
+state_db = Path(__file__).parent / 'q3_state.db'
+
+def decode_batch(values, fmt, decoder=None):
+    """One DataFrame for a polled batch of raw message values."""
+    if fmt == 'avro':
+        # Tuples in trip_wire.FIELDS order, no dict per message.
+        return pd.DataFrame.from_records([decoder.decode(value) for value in values], columns=trip_wire.FIELDS)
+    return pd.read_json(io.BytesIO(b'\n'.join(values)), lines=True)
+
+def initial_state():
+    return {'total': 0, 'count_gt5': 0}
+
+def count_trips(worker, args):
+    """Consume this worker's share of the partitions, checkpointing per-partition counts with their offsets."""
+    decoder = trip_wire.AvroDecoder(args.registry_url) if args.format == 'avro' else None
+    consumer = KafkaConsumer(
+        bootstrap_servers=[server],
+        auto_offset_reset='earliest',
+        group_id=group_id,
+        enable_auto_commit=False,
+    )
+    store = CheckpointStore(args.state_db, group_id)
+
+    def update(state, messages):
+        trips = decode_batch([message.value for message in messages], args.format, decoder)
+        state['total'] += len(trips)
+        state['count_gt5'] += int((trips['trip_distance'] > 5.0).sum())
+        print(f"[worker {worker}] Processed {state['total']} records of this partition...")
+
+    try:
+        StatefulConsumer(consumer, topic_name, store, initial_state, args.checkpoint_interval).run(
+            update, max_records=args.max_records, idle_timeout=args.idle_timeout,
+        )
+    finally:
+        store.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Count green trips longer than 5 miles")
+    parser.add_argument('--format', choices=['json', 'avro'], default='json', help="Message encoding the producer used")
+    parser.add_argument('--registry_url', default=trip_wire.REGISTRY_URL, help="Schema registry for --format avro")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Consumer processes in the group (more than the topic's partitions will sit idle)")
+    parser.add_argument('--max_records', type=int, default=5000, help="Records per poll")
+    parser.add_argument('--idle_timeout', type=float, default=10, help="Seconds without records before stopping")
+    parser.add_argument('--checkpoint_interval', type=float, default=5,
+                        help="Seconds between snapshots of counts and offsets (the most a crash replays)")
+    parser.add_argument('--state_db', default=str(state_db), help="SQLite file holding the checkpoints")
+    parser.add_argument('--reset', action='store_true', help="Drop the checkpoints and count the topic from the start")
+    args = parser.parse_args()
+
+    print(f"Counting trips with trip_distance > 5.0 in topic {topic_name}...")
+
+    store = CheckpointStore(args.state_db, group_id)
+    if args.reset:
+        store.reset(topic_name)
+
+    if args.workers == 1:
+        count_trips(0, args)
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            list(pool.map(count_trips, range(args.workers), [args] * args.workers))
+
+    # The result is every partition's checkpointed counts, including those of earlier (crashed) runs.
+    states = store.states(topic_name)
+    store.close()
+    total = sum(state['total'] for state in states)
+    count_gt5 = sum(state['count_gt5'] for state in states)
+    print(f"\nTotal processed: {total}")
+    print(f"Number of trips with trip_distance > 5.0: {count_gt5}")
 
-def json_deserializer(data):
-    return json.loads(data.decode('utf-8'))
-
-consumer = KafkaConsumer(
-    topic_name,
-    bootstrap_servers=[server],
-    auto_offset_reset='earliest',
-    group_id='q3-consumer',
-    value_deserializer=json_deserializer,
-    consumer_timeout_ms=10000
-)
-
-print(f"Counting trips with trip_distance > 5.0 in topic {topic_name}...")
-
-count_gt5 = 0
-total = 0
-
-for message in consumer:
-    data = message.value
-    total += 1
-    trip_distance = data.get('trip_distance')
-    if trip_distance is not None and trip_distance > 5.0:
-        count_gt5 += 1
-    if total % 5000 == 0:
-        print(f"Processed {total} records...")
-
-consumer.close()
-print(f"\nTotal processed: {total}")
-print(f"Number of trips with trip_distance > 5.0: {count_gt5}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,18 @@
+import argparse
+
 from pyflink.datastream import StreamExecutionEnvironment
 from pyflink.table import EnvironmentSettings, StreamTableEnvironment
 
-def create_green_trips_source(t_env):
-    source_ddl = """
+import flink_job
+import trip_wire
+
+def create_green_trips_source(t_env, fmt='json'):
+    timestamp_type, event_time, format_options = trip_wire.flink_source_format(fmt)
+    source_ddl = f"""
         CREATE TABLE green_trips (
-            lpep_pickup_datetime STRING,
+            lpep_pickup_datetime {timestamp_type},
             tip_amount DOUBLE,
-            event_time AS TO_TIMESTAMP(lpep_pickup_datetime, 'yyyy-MM-dd HH:mm:ss'),
+            event_time AS {event_time},
             WATERMARK FOR event_time AS event_time - INTERVAL '5' SECOND
         ) WITH (
             'connector' = 'kafka',
@@ -14,7 +20,7 @@ def create_green_trips_source(t_env):
             'topic' = 'green-trips',
             'scan.startup.mode' = 'earliest-offset',
             'properties.auto.offset.reset' = 'earliest',
-            'format' = 'json'
+            {format_options}
         );
     """
     t_env.execute_sql(source_ddl)
@@ -38,23 +44,27 @@ def create_hourly_tips_sink(t_env):
     return "hourly_tips_sink"
 
 def main():
+    parser = argparse.ArgumentParser()
+    flink_job.add_job_options(parser)
+    args = parser.parse_args()
+
     env = StreamExecutionEnvironment.get_execution_environment()
-    env.set_parallelism(1)
     env.enable_checkpointing(10 * 1000)
 
     settings = EnvironmentSettings.new_instance().in_streaming_mode().build()
     t_env = StreamTableEnvironment.create(env, environment_settings=settings)
+    flink_job.configure_job(env, t_env, args)
 
-    source_table = create_green_trips_source(t_env)
+    source_table = create_green_trips_source(t_env, args.format)
     sink_table = create_hourly_tips_sink(t_env)
 
     t_env.execute_sql(f"""
         INSERT INTO {sink_table}
         SELECT
-            TUMBLE_START(event_time, INTERVAL '1' HOUR) AS window_start,
+            window_start,
             SUM(tip_amount) AS total_tip_amount
-        FROM {source_table}
-        GROUP BY TUMBLE(event_time, INTERVAL '1' HOUR)
+        FROM TABLE(TUMBLE(TABLE {source_table}, DESCRIPTOR(event_time), INTERVAL '1' HOUR))
+        GROUP BY window_start, window_end
     """).wait()
 
 if __name__ == "__main__":
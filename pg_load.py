@@ -0,0 +1,184 @@
+"""Postgres loading helpers shared by the taxi ingest scripts.
+
+hw1/pipeline, hw1/homework and hw2/kestra each read their own source format into
+DataFrame chunks; everything from creating the target table to publishing it
+lives here:
+
+- create_table / load_chunk (INSERT via to_sql, or COPY ... FROM STDIN)
+- downcast / sql_types for --compact
+- swap_in for --staging: index the UNLOGGED staging table, then rename it over the live one
+- attach_partition for --partitioned: swap a month in as a partition of a range-partitioned parent
+
+The scripts import it from the repo root; their images copy it next to the script.
+"""
+import io
+
+import click
+from sqlalchemy import REAL, SmallInteger, Text, text
+
+# Narrow per-chunk types for --compact; Postgres gets SMALLINT/REAL columns to match.
+compact_dtype = {
+    "VendorID": "Int8",
+    "passenger_count": "Int8",
+    "RatecodeID": "Int8",
+    "payment_type": "Int8",
+    "trip_type": "Int8",
+    "PULocationID": "Int16",
+    "DOLocationID": "Int16",
+    "trip_distance": "float32",
+    "fare_amount": "float32",
+    "extra": "float32",
+    "mta_tax": "float32",
+    "tip_amount": "float32",
+    "tolls_amount": "float32",
+    "ehail_fee": "float32",
+    "improvement_surcharge": "float32",
+    "total_amount": "float32",
+    "congestion_surcharge": "float32",
+    "airport_fee": "float32",
+    "store_and_fwd_flag": "category",
+}
+
+compact_sql_types = {
+    "Int8": SmallInteger(),
+    "Int16": SmallInteger(),
+    "float32": REAL(),
+    "category": Text(),
+}
+
+
+def downcast(df_chunk):
+    """Cast the columns the chunk has to compact_dtype."""
+    return df_chunk.astype({c: t for c, t in compact_dtype.items() if c in df_chunk.columns})
+
+
+def sql_types(df_chunk):
+    return {c: compact_sql_types[str(t)] for c, t in df_chunk.dtypes.items() if str(t) in compact_sql_types}
+
+
+def create_table(df_chunk, target_table, engine, unlogged=False):
+    """(Re)create the target table from the chunk's dtypes."""
+    df_chunk.head(0).to_sql(name=target_table, con=engine, if_exists="replace", dtype=sql_types(df_chunk))
+    if unlogged:
+        # Staging tables skip WAL; swap_in() makes them durable before publishing.
+        with engine.begin() as conn:
+            conn.execute(text(f'ALTER TABLE "{target_table}" SET UNLOGGED'))
+
+
+def copy_chunk(df_chunk, target_table, conn):
+    """Stream a chunk into Postgres with COPY ... FROM STDIN via an in-memory CSV buffer."""
+    buffer = io.StringIO()
+    df_chunk.to_csv(buffer, header=False)
+    buffer.seek(0)
+
+    columns = [df_chunk.index.name or "index", *df_chunk.columns]
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    with conn.connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY "{target_table}" ({column_list}) FROM STDIN WITH (FORMAT csv)',
+            buffer,
+        )
+
+
+def load_chunk(df_chunk, target_table, conn, load_method):
+    if load_method == "copy":
+        copy_chunk(df_chunk, target_table, conn)
+    else:
+        df_chunk.to_sql(name=target_table, con=conn, if_exists="append")
+
+
+index_suffixes = ["pickup_brin", "dropoff_brin", "pu_idx", "do_idx"]
+
+
+def build_indexes(conn, table, pickup_col, dropoff_col):
+    """Build the trip table indexes in one pass after the bulk load instead of per row."""
+    conn.execute(text(f'CREATE INDEX IF NOT EXISTS "{table}_pickup_brin" ON "{table}" USING brin ("{pickup_col}")'))
+    conn.execute(text(f'CREATE INDEX IF NOT EXISTS "{table}_dropoff_brin" ON "{table}" USING brin ("{dropoff_col}")'))
+    conn.execute(text(f'CREATE INDEX IF NOT EXISTS "{table}_pu_idx" ON "{table}" ("PULocationID")'))
+    conn.execute(text(f'CREATE INDEX IF NOT EXISTS "{table}_do_idx" ON "{table}" ("DOLocationID")'))
+
+
+def rename_table(conn, old_name, new_name):
+    conn.execute(text(f'ALTER TABLE "{old_name}" RENAME TO "{new_name}"'))
+    for suffix in index_suffixes:
+        conn.execute(text(f'ALTER INDEX "{old_name}_{suffix}" RENAME TO "{new_name}_{suffix}"'))
+    # to_sql's index on the DataFrame index; left behind, it blocks the next load table of the old name.
+    conn.execute(text(f'ALTER INDEX IF EXISTS "ix_{old_name}_index" RENAME TO "ix_{new_name}_index"'))
+
+
+def swap_in(engine, staging_table, target_table, datetime_cols):
+    """Index the loaded staging table and rename it over the live table in a single transaction."""
+    with engine.begin() as conn:
+        build_indexes(conn, staging_table, *datetime_cols)
+        conn.execute(text(f'ALTER TABLE "{staging_table}" SET LOGGED'))
+
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE IF EXISTS "{target_table}"'))
+        rename_table(conn, staging_table, target_table)
+
+
+def attach_partition(engine, table, parent_table, year, month, datetime_cols, source_file, unlogged=False):
+    """Swap a loaded month in as the [month, next month) partition of a range-partitioned parent.
+
+    The parent is partitioned on the pickup datetime and created on first use with a DEFAULT
+    partition. Every row carries the file it came from in source_file. Stray rows outside the
+    month (TLC files always carry a few) are routed through the parent, replacing the strays the
+    previous load of the same file left there, so reloading a month never duplicates them. Rows
+    parked in the default partition for this month are pulled in, otherwise ATTACH would fail,
+    and rows other files put in the old partition are carried over before it is dropped.
+    Indexing happens before the short swap transaction.
+    """
+    pickup_col, dropoff_col = datetime_cols
+    partition = f"{parent_table}_{year}_{month:02d}"
+    start = f"{year}-{month:02d}-01"
+    end = f"{year + month // 12}-{month % 12 + 1:02d}-01"
+    in_month = f"\"{pickup_col}\" >= '{start}' AND \"{pickup_col}\" < '{end}'"
+    strays = f'NOT ({in_month}) OR "{pickup_col}" IS NULL'
+    file_literal = source_file.replace("'", "''")
+
+    with engine.begin() as conn:
+        # DDL takes no bind parameters; the default only fills the loaded rows and is dropped again.
+        conn.execute(text(f"ALTER TABLE \"{table}\" ADD COLUMN source_file TEXT DEFAULT '{file_literal}'"))
+        conn.execute(text(f'ALTER TABLE "{table}" ALTER COLUMN source_file DROP DEFAULT'))
+        kind = conn.execute(
+            text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"), {"name": f'"{parent_table}"'}
+        ).scalar()
+        if kind == "r":
+            raise click.ClickException(
+                f"{parent_table} exists and is not partitioned; drop or rename it before using --partitioned"
+            )
+        if kind is None:
+            conn.execute(text(
+                f'CREATE TABLE "{parent_table}" (LIKE "{table}" INCLUDING DEFAULTS) '
+                f'PARTITION BY RANGE ("{pickup_col}")'
+            ))
+            conn.execute(text(f'CREATE TABLE "{parent_table}_default" PARTITION OF "{parent_table}" DEFAULT'))
+            build_indexes(conn, parent_table, pickup_col, dropoff_col)
+        else:
+            conn.execute(text(f'ALTER TABLE "{parent_table}" ADD COLUMN IF NOT EXISTS source_file TEXT'))
+
+        conn.execute(text(f'DELETE FROM "{parent_table}" WHERE source_file = :file AND ({strays})'),
+                     {"file": source_file})
+        conn.execute(text(f'INSERT INTO "{parent_table}" SELECT * FROM "{table}" WHERE {strays}'))
+        conn.execute(text(f'DELETE FROM "{table}" WHERE {strays}'))
+        # Postgres skips ATTACH's validation scan (run while the parent is locked) only when
+        # the constraints prove the range; the CHECK alone does not rule out NULL pickups.
+        conn.execute(text(f'ALTER TABLE "{table}" ALTER COLUMN "{pickup_col}" SET NOT NULL'))
+        conn.execute(text(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_month_check" CHECK ({in_month})'))
+        if unlogged:
+            conn.execute(text(f'ALTER TABLE "{table}" SET LOGGED'))
+        build_indexes(conn, table, pickup_col, dropoff_col)
+
+    with engine.begin() as conn:
+        conn.execute(text(f'INSERT INTO "{table}" SELECT * FROM "{parent_table}_default" WHERE {in_month}'))
+        conn.execute(text(f'DELETE FROM "{parent_table}_default" WHERE {in_month}'))
+        if conn.execute(text("SELECT to_regclass(:name)"), {"name": f'"{partition}"'}).scalar():
+            conn.execute(text(f'INSERT INTO "{table}" SELECT * FROM "{partition}" '
+                              f"WHERE source_file IS DISTINCT FROM :file"), {"file": source_file})
+            conn.execute(text(f'ALTER TABLE "{parent_table}" DETACH PARTITION "{partition}"'))
+            conn.execute(text(f'DROP TABLE "{partition}"'))
+        rename_table(conn, table, partition)
+        conn.execute(text(
+            f'ALTER TABLE "{parent_table}" ATTACH PARTITION "{partition}" '
+            f"FOR VALUES FROM ('{start}') TO ('{end}')"
+        ))
@@ -0,0 +1,242 @@
+"""Local download cache for NYC TLC files, shared by the ingest scripts.
+
+Every URL gets its own directory under $TLC_CACHE_DIR (default ~/.cache/tlc)
+holding the file under its original name plus a meta.json with the ETag,
+Content-Length and sha256 it was downloaded with. A cached copy is reused
+while a HEAD request still reports the same ETag/Content-Length and the
+checksum still matches. Downloads go to a temp file and are renamed into place,
+so a crashed run never leaves a half-written entry behind. The least recently
+used entries are evicted once the cache grows past $TLC_CACHE_MAX_BYTES.
+
+Set TLC_CACHE_OFFLINE=1 to never touch the network: cached files are served
+as-is and anything missing raises CacheMiss.
+
+    python tlc_cache.py <url>   # prints the local path
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+
+CACHE_DIR = Path(os.environ.get("TLC_CACHE_DIR", Path.home() / ".cache" / "tlc"))
+MAX_BYTES = int(os.environ.get("TLC_CACHE_MAX_BYTES", 20 * 1024**3))
+OFFLINE = os.environ.get("TLC_CACHE_OFFLINE", "") not in ("", "0")
+BLOCK_SIZE = 1 << 20
+TIMEOUT = 60
+
+
+class CacheMiss(FileNotFoundError):
+    """Raised in offline mode when a URL has no valid cached copy."""
+
+
+class _KeepMethodRedirectHandler(urllib.request.HTTPRedirectHandler):
+    # urllib turns a redirected HEAD into a GET; github release assets always redirect.
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        new_req = super().redirect_request(req, fp, code, msg, headers, newurl)
+        if new_req is not None:
+            new_req.method = req.get_method()
+        return new_req
+
+
+_head_opener = urllib.request.build_opener(_KeepMethodRedirectHandler)
+
+
+def remote_version(url):
+    """Return (etag, content_length) as reported by a HEAD request."""
+    request = urllib.request.Request(url, method="HEAD")
+    with _head_opener.open(request, timeout=TIMEOUT) as response:
+        return response.headers.get("ETag"), response.headers.get("Content-Length")
+
+
+def _entry_dir(url):
+    return CACHE_DIR / hashlib.sha256(url.encode()).hexdigest()[:32]
+
+
+def _data_path(url):
+    name = Path(urllib.parse.urlparse(url).path).name or "data"
+    return _entry_dir(url) / name
+
+
+def _read_meta(entry):
+    try:
+        return json.loads((entry / "meta.json").read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(entry, meta):
+    fd, tmp = tempfile.mkstemp(dir=entry, suffix=".meta")
+    with os.fdopen(fd, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, entry / "meta.json")
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _is_valid(path, meta):
+    try:
+        if path.stat().st_size != meta["size"]:
+            return False
+    except OSError:
+        return False
+    return _sha256(path) == meta["sha256"]
+
+
+def _touch(entry):
+    # meta.json's mtime doubles as the LRU timestamp.
+    try:
+        os.utime(entry / "meta.json")
+    except OSError:
+        pass
+
+
+def _fresh_copy(url, offline):
+    """Return (path, None) for a usable cached copy, else (None, (etag, content_length))."""
+    path = _data_path(url)
+    meta = _read_meta(path.parent)
+
+    if offline:
+        if meta is not None and _is_valid(path, meta):
+            return path, None
+        raise CacheMiss(f"{url} is not cached and offline mode is on")
+
+    try:
+        etag, length = remote_version(url)
+    except urllib.error.HTTPError:
+        raise
+    except OSError:
+        # Network is down: a verified copy is still better than failing the run.
+        if meta is not None and _is_valid(path, meta):
+            return path, None
+        raise
+
+    if (meta is not None and meta["etag"] == etag and meta["content_length"] == length
+            and _is_valid(path, meta)):
+        return path, None
+    return None, (etag, length)
+
+
+def _download(url, etag, length):
+    """Yield url's blocks while writing them to a temp file, then move it into the cache."""
+    path = _data_path(url)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f, urllib.request.urlopen(url, timeout=TIMEOUT) as response:
+            while block := response.read(BLOCK_SIZE):
+                f.write(block)
+                digest.update(block)
+                size += len(block)
+                yield block
+        if length is not None and size != int(length):
+            raise OSError(f"Truncated download of {url}: got {size} of {length} bytes")
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+    _write_meta(path.parent, {
+        "url": url,
+        "file": path.name,
+        "etag": etag,
+        "content_length": length,
+        "size": size,
+        "sha256": digest.hexdigest(),
+    })
+    evict(keep=path.parent)
+
+
+def iter_blocks(url, offline=None):
+    """Yield url's content in BLOCK_SIZE blocks.
+
+    Served from the cache when fresh; otherwise streamed from the network while
+    the cache entry is filled, so callers can start parsing before the download ends.
+    """
+    offline = OFFLINE if offline is None else offline
+    path, version = _fresh_copy(url, offline)
+    if path is None:
+        yield from _download(url, *version)
+        return
+
+    _touch(path.parent)
+    with open(path, "rb") as f:
+        while block := f.read(BLOCK_SIZE):
+            yield block
+
+
+def fetch(url, offline=None):
+    """Return the local path of url's content, downloading it only if the cache is missing or stale."""
+    offline = OFFLINE if offline is None else offline
+    path, version = _fresh_copy(url, offline)
+    if path is None:
+        for _ in _download(url, *version):
+            pass
+        return _data_path(url)
+
+    _touch(path.parent)
+    return path
+
+
+def cached_meta(url):
+    """The cache entry's metadata (etag, content_length, size, sha256), or None if url is not cached."""
+    return _read_meta(_entry_dir(url))
+
+
+def put(url, src):
+    """Store a local file as url's cached content, e.g. to seed offline runs or benchmarks."""
+    path = _data_path(url)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".part")
+    os.close(fd)
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, path)
+    _write_meta(path.parent, {
+        "url": url,
+        "file": path.name,
+        "etag": None,
+        "content_length": None,
+        "size": path.stat().st_size,
+        "sha256": _sha256(path),
+    })
+    return path
+
+
+def evict(max_bytes=None, keep=None):
+    """Drop least recently used entries until the cache fits in max_bytes."""
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    for meta_path in CACHE_DIR.glob("*/meta.json"):
+        meta = _read_meta(meta_path.parent)
+        try:
+            entries.append((meta_path.stat().st_mtime, meta["size"], meta_path.parent))
+        except (OSError, TypeError, KeyError):
+            continue
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= max_bytes:
+            break
+        if entry == keep:
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
+
+if __name__ == "__main__":
+    for arg in sys.argv[1:]:
+        print(fetch(arg))